@@ -1,7 +1,10 @@
-from shared import Division, GameData, GameMetadata, PlayerScore, Site, get_discord_user
-import sheets
+from shared import Division, Route, Site
+from scoring import colonist_trivia, score_colonist
+from singleflight import Once, SingleFlight
+from submission import ParsedReplay, Submission, to_submission
+import cpu_pool
 
-from datetime import datetime
+from concurrent.futures import Future
 import re
 import discord
 import requests
@@ -14,78 +17,42 @@ HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/89.0.4389.82 Safari/537.36",
 }
 
+# players often post the same game at once, so share one fetch & scoring between them
+inflight: SingleFlight[tuple[int, Division, Site, str], ParsedReplay] = SingleFlight()
 
-def colonist(message: discord.Message, div: Division) -> GameData | None:
+
+def colonist(message: discord.Message, route: Route) -> Submission | None:
     slug_matches = re.findall(COLONIST_REPLAY_REGEX, message.content, re.DOTALL)
     if len(slug_matches) == 0:
         return None
-    data = query_colonist(slug_matches[0])
+    slug = slug_matches[0]
 
-    played_at = datetime.fromisoformat(
-        data["eventHistory"]["startTime"].replace("Z", "+00:00")
+    replay, is_shared = inflight.do(
+        (route.league_id, route.division, Site.COLONIST, slug),
+        lambda: parse_colonist(slug),
     )
+    return to_submission(message, route, replay, is_shared)
 
-    colors_to_names: dict[int, str] = {
-        player["selectedColor"]: player["username"]
-        for player in data["playerUserStates"]
-    }
-
-    game_players = data["eventHistory"]["endGameState"]["players"]
-
-    members = message.guild.members  # type: ignore
-    gapi_creds = sheets.get_creds()
-
-    game_data = GameData(metadata=None, scores=[], raw_json=data)
-
-    for player in game_players.values():
-        name = colors_to_names[player["color"]]
-
-        discord_name = sheets.translate_name(gapi_creds, div, name)
-        discord_user = get_discord_user(members, discord_name) if discord_name else None
 
-        vp_data = player["victoryPoints"]
-        settles = vp_data.get("0", 0)
-        cities = vp_data.get("1", 0)
-        vp_devs = vp_data.get("2", 0)
-        largest_army = vp_data.get("3", 0)
-        longest_road = vp_data.get("4", 0)
-        ck_metropolis = vp_data.get("6", 0)
-        ck_catan_points = vp_data.get("7", 0)
-        ck_vps = vp_data.get("8", 0)
-        ck_merchant = vp_data.get("9", 0)
+def parse_colonist(slug: str) -> ParsedReplay:
+    payload = query_colonist(slug)
+    scored = cpu_pool.run("colonist", score_colonist, payload)
 
-        score = sum(
-            (
-                settles,
-                cities * 2,
-                vp_devs,
-                largest_army * 2,
-                longest_road * 2,
-                ck_metropolis * 2,
-                ck_catan_points,
-                ck_vps,
-                ck_merchant,
-            )
-        )
-
-        game_data.scores.append(
-            PlayerScore.from_names(discord_user, discord_name, name, score)
-        )
-
-    game_data.metadata = GameMetadata(
-        division=div,
+    return ParsedReplay(
         site=Site.COLONIST,
-        replay_link=f"https://colonist.io/replay/{slug_matches[0]}",
-        timestamp=played_at,
-        is_duplicate=False
+        replay_link=f"https://colonist.io/replay/{slug}",
+        played_at=scored.played_at,
+        scores=scored.scores,
+        raw_response=payload,
+        # everyone sharing this replay shares the trivia as well
+        enrich=Once(
+            lambda: cpu_pool.run("colonist", colonist_trivia, scored.trivia_input)
+        ),
+        recorded=Future(),
     )
 
-    sheets.update(gapi_creds, div, game_data)
-
-    return game_data
-
 
-def query_colonist(game: str):
+def query_colonist(game: str) -> bytes:
     api_url = f"https://colonist.io/api/replay/data-from-slug?replayUrlSlug={game}"
     res = requests.get(api_url, headers=HEADERS)
     if res.status_code != 200:
@@ -93,4 +60,5 @@ def query_colonist(game: str):
             f"colonist.io api call to {api_url} failed with {res.status_code}, {res.json()}"
         )
 
-    return res.json()["data"]
+    # decoding is left to the cpu pool, big games take a while to parse
+    return res.content
@@ -0,0 +1,69 @@
+import metrics
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, TypeVar
+import multiprocessing
+import os
+import threading
+
+
+A = TypeVar("A")
+T = TypeVar("T")
+
+pool: ProcessPoolExecutor | None = None
+pool_lock = threading.Lock()
+
+
+def get_pool_size() -> int:
+    # 0 keeps everything in the bot process
+    return int(os.getenv("CPU_WORKERS", "0"))
+
+
+def get_pool() -> ProcessPoolExecutor | None:
+    global pool
+
+    with pool_lock:
+        if pool is None and get_pool_size() > 0:
+            # forking a process that's already running threads isn't safe
+            pool = ProcessPoolExecutor(
+                max_workers=get_pool_size(),
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return pool
+
+
+def run(name: str, f: Callable[[A], tuple[T, dict[str, float]]], payload: A) -> T:
+    """Runs a scoring function from scoring.py, in the pool if there is one."""
+    pool = get_pool()
+    if pool is None:
+        result, cpu_times = f(payload)
+    else:
+        try:
+            result, cpu_times = pool.submit(f, payload).result()
+        except BrokenProcessPool:
+            # a worker died (e.g. oom on a huge replay), so start over with a fresh pool.
+            # not retried inline, the same replay could take the bot down with it
+            reset_pool(pool)
+            raise
+
+    for stage, cpu_time in cpu_times.items():
+        metrics.record(f"cpu.{name}.{stage}", cpu_time)
+
+    return result
+
+
+def reset_pool(broken: ProcessPoolExecutor):
+    global pool
+
+    with pool_lock:
+        # another thread may have replaced it already
+        if pool is broken:
+            pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown():
+    with pool_lock:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
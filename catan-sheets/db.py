@@ -1,8 +1,11 @@
 from __future__ import annotations
 from shared import Division, Site
 from typing import List, Optional
-from sqlalchemy import TIMESTAMP, Enum, ForeignKey, create_engine, Column, Integer, String, Boolean, JSON
+from sqlalchemy import TIMESTAMP, Enum, Float, ForeignKey, UniqueConstraint, create_engine, delete, Column, Integer, String, Boolean, JSON, Text
+from sqlalchemy.exc import IntegrityError, OperationalError
 from sqlalchemy.orm import sessionmaker, DeclarativeBase, Mapped, relationship
+import time
+import uuid
 
 
 engine = create_engine("sqlite:///main.db")
@@ -32,11 +35,22 @@ class Game(Base):
     timestamp = Column(TIMESTAMP, nullable=False)
     is_duplicate = Column(Boolean, nullable=False)  # denormalizin' like there's no tomorro'
     is_old_game = Column(Boolean, nullable=False)
-    game_json = Column(JSON)
+    game_json = Column(JSON)  # the replay's "data", newer games keep theirs in GameReplay
 
     players: Mapped[List[GamePlayer]] = relationship(back_populates="game")
 
 
+class GameReplay(Base):
+    __tablename__ = "game_replays"
+
+    # the replay api response exactly as received, so it never has to be decoded and
+    # dumped again just to be stored
+    response = Column(Text, nullable=False)
+
+    game_id = Column(Integer, ForeignKey("games.uid"), nullable=False, unique=True)
+    game: Mapped[Game] = relationship()
+
+
 class GamePlayer(Base):
     __tablename__ = "game_players"
 
@@ -49,6 +63,50 @@ class GamePlayer(Base):
     player: Mapped[Optional[Player]] = relationship(back_populates="games")
 
 
+class GameFingerprint(Base):
+    __tablename__ = "game_fingerprints"
+    __table_args__ = (UniqueConstraint("league_id", "fingerprint"),)
+
+    # see shared.game_fingerprint, identical for every perspective of the same game
+    fingerprint = Column(String, nullable=False)
+    replay_link = Column(String, nullable=False)  # whoever claimed it first
+
+    league_id = Column(Integer, ForeignKey("leagues.uid"), nullable=False)
+
+
+class League(Base):
+    __tablename__ = "leagues"
+
+    name = Column(String, nullable=False, unique=True)
+    spreadsheet_id = Column(String, nullable=False)
+    err_channel_id = Column(String)
+    workers = Column(Integer, nullable=False, default=4)  # games processed in parallel
+    is_active = Column(Boolean, nullable=False, default=True)
+
+    channels: Mapped[List[LeagueChannel]] = relationship(back_populates="league")
+
+
+class LeagueChannel(Base):
+    __tablename__ = "league_channels"
+
+    channel_id = Column(String, nullable=False, unique=True)
+    div = Column(Enum(Division), nullable=False)
+    sheet_col = Column(String, nullable=False)  # first column of the division's entries
+
+    league_id = Column(Integer, ForeignKey("leagues.uid"), nullable=False)
+    league: Mapped[League] = relationship(back_populates="channels")
+
+
+class SheetLock(Base):
+    __tablename__ = "sheet_locks"
+    __table_args__ = (UniqueConstraint("spreadsheet_id", "sheet_col"),)
+
+    spreadsheet_id = Column(String, nullable=False)
+    sheet_col = Column(String, nullable=False)
+    expires_at = Column(Float, nullable=False)  # epoch, in case the holder died
+    token = Column(String, nullable=False)  # not the uid, sqlite reuses those
+
+
 def get_engine():
     return engine
 
@@ -57,5 +115,76 @@ def get_session():
     return session_maker()
 
 
+def claim_fingerprint(league_id: int, fingerprint: str, replay_link: str) -> bool:
+    """Returns False if the game was already submitted. The unique index makes this safe
+    across threads and bot processes."""
+    session = get_session()
+    try:
+        session.add(
+            GameFingerprint(
+                league_id=league_id, fingerprint=fingerprint, replay_link=replay_link
+            )
+        )
+        session.commit()
+        return True
+    except IntegrityError:
+        session.rollback()
+        return False
+    finally:
+        session.close()
+
+
+def release_fingerprint(league_id: int, fingerprint: str):
+    session = get_session()
+    try:
+        session.execute(
+            delete(GameFingerprint).where(
+                GameFingerprint.league_id == league_id,
+                GameFingerprint.fingerprint == fingerprint,
+            )
+        )
+        session.commit()
+    finally:
+        session.close()
+
+
+def acquire_sheet_lock(spreadsheet_id: str, sheet_col: str, ttl: float) -> str | None:
+    """Returns a token for release_sheet_lock, or None if someone else holds the lock.
+    Works across bot processes, unlike a threading.Lock."""
+    session = get_session()
+    try:
+        session.execute(
+            delete(SheetLock).where(
+                SheetLock.spreadsheet_id == spreadsheet_id,
+                SheetLock.sheet_col == sheet_col,
+                SheetLock.expires_at < time.time(),
+            )
+        )
+        lock = SheetLock(
+            spreadsheet_id=spreadsheet_id,
+            sheet_col=sheet_col,
+            expires_at=time.time() + ttl,
+            token=uuid.uuid4().hex,
+        )
+        session.add(lock)
+        session.commit()
+        return lock.token
+    except (IntegrityError, OperationalError):  # taken, or sqlite busy with another process
+        session.rollback()
+        return None
+    finally:
+        session.close()
+
+
+def release_sheet_lock(token: str):
+    session = get_session()
+    try:
+        # by token, so a lock that expired and got taken over isn't released
+        session.execute(delete(SheetLock).where(SheetLock.token == token))
+        session.commit()
+    finally:
+        session.close()
+
+
 def start():
     Base.metadata.create_all(engine)
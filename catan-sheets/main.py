@@ -1,66 +1,161 @@
+import cpu_pool
 import db
-from shared import Division
+import metrics
+import routing
+import submission
+from shared import Division, Route
 from colonist import colonist
 from twosheep import twosheep, get_twosheep_api_key
 
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor
 import os
 import traceback
 import collections
+import asyncio
 import random
+import time
 
 
-load_dotenv()
+LEAGUE_QUEUE_SIZE = 100
+# recording and trivia run side by side for every game
+THREADS_PER_WORKER = 2
 
-intents = discord.Intents.default()
-intents.message_content = True
-intents.members = True
-bot = commands.Bot(command_prefix="!", intents=intents)
+# seconds each stage gets after the first reply before we stop waiting in silence
+RECORD_DEADLINE = 10.0
+TRIVIA_DEADLINE = 5.0
 
 
-DIV1_CHANNELS = [827273190014320652, 1324153205575389207]
-DIV2_CHANNELS = [827274292244512780, 1324207273785954364]
-CK_CHANNELS = [879366959202983936, 1324500081189060729]
-ERR_CHANNEL = 1324202972997091480
+def get_shard_config():
+    # guilds get split between processes by running each with its own SHARD_IDS
+    shard_count = os.getenv("SHARD_COUNT")
+    if shard_count is None:
+        return {}
+
+    shard_ids = os.getenv("SHARD_IDS")
+    return {
+        "shard_count": int(shard_count),
+        "shard_ids": [int(i) for i in shard_ids.split(",")] if shard_ids else None,
+    }
+
+
+# set up in main(), the cpu pool's worker processes import this module as well and
+# shouldn't be building a bot of their own
+bot: commands.AutoShardedBot = None  # type: ignore
+background_loops: list[tasks.Loop] = []
+
+
+def create_bot():
+    intents = discord.Intents.default()
+    intents.message_content = True
+    intents.members = True
+    bot = commands.AutoShardedBot(
+        command_prefix="!", intents=intents, **get_shard_config()
+    )
+    bot.event(on_ready)
+    bot.event(on_message)
+    return bot
+
+
+class LeagueWorkers:
+    """Each league gets its own queue and threads, so a busy league can't starve the others."""
+
+    def __init__(self, route: Route):
+        self.queue: asyncio.Queue[tuple[discord.Message, Route, float]] = asyncio.Queue(
+            maxsize=LEAGUE_QUEUE_SIZE
+        )
+        # worker count changes only apply after a restart, routing changes apply right away
+        self.executor = ThreadPoolExecutor(
+            max_workers=route.workers * THREADS_PER_WORKER,
+            thread_name_prefix=f"league-{route.league_id}",
+        )
+        self.tasks = [asyncio.create_task(self.work()) for _ in range(route.workers)]
+
+    async def work(self):
+        while True:
+            message, route, received_at = await self.queue.get()
+            try:
+                await process_message(message, route, self.executor, received_at)
+            except Exception:
+                await report_error(message, route)
+            finally:
+                self.queue.task_done()
+
+
+league_workers: dict[int, LeagueWorkers] = {}
+
+
+async def reload_routes():
+    # an uncaught error would stop the loop for good, so just keep the old routes
+    try:
+        await asyncio.to_thread(routing.reload_routes)
+    except Exception:
+        traceback.print_exc()
+
+
+async def report_metrics():
+    report = metrics.report()
+    if report:
+        print(report)
 
 
-@bot.event
 async def on_ready():
     print(f"Logged in as {bot.user}")
+    for loop in background_loops:
+        if not loop.is_running():
+            loop.start()
 
 
-@bot.event
 async def on_message(message: discord.Message):
+    route = routing.get_route(message.channel.id)
+    if route is None or message.author.bot:
+        return
+
+    if route.league_id not in league_workers:
+        league_workers[route.league_id] = LeagueWorkers(route)
+
     try:
-        await process_message(message)
-    except Exception as err:
+        league_workers[route.league_id].queue.put_nowait(
+            (message, route, time.perf_counter())
+        )
+    except asyncio.QueueFull:
         try:
-            tb = traceback.format_exc()
-            print(tb)
-            await bot.get_channel(ERR_CHANNEL).send(f"Error: {tb}")  # type: ignore
-            # await message.channel.send(f"Processing failed due to error.\n\n{str(err)}")
-            await message.channel.send(f"Processing failed due to error.")
+            await message.channel.send(
+                "Too many games are being processed right now, please repost in a minute.",
+                reference=message,
+            )
         except Exception as e:
-            print('double error', e)
+            print("queue full error", e)
 
 
-naughty_list = collections.deque(maxlen=10)
+async def report_error(message: discord.Message, route: Route):
+    try:
+        tb = traceback.format_exc()
+        print(tb)
+        # await message.channel.send(f"Processing failed due to error.\n\n{str(err)}")
+        await message.channel.send(f"Processing failed due to error.")
+        # the error channel's guild might be on another shard, so it can be missing here
+        err_channel = (
+            bot.get_channel(route.err_channel_id) if route.err_channel_id else None
+        )
+        if err_channel is not None:
+            await err_channel.send(f"Error: {tb}")  # type: ignore
+    except Exception as e:
+        print('double error', e)
 
 
-async def process_message(message: discord.Message):
-    if message.channel.id in DIV1_CHANNELS:
-        div = Division.DIV1
-    elif message.channel.id in DIV2_CHANNELS:
-        div = Division.DIV2
-    elif message.channel.id in CK_CHANNELS:
-        div = Division.CK
-    else:
-        return
+naughty_list = collections.deque(maxlen=10)
 
-    if message.author.bot:
-        return
+
+async def process_message(
+    message: discord.Message,
+    route: Route,
+    executor: ThreadPoolExecutor,
+    received_at: float,
+):
+    div = route.division
 
     if message.content == "ping":
         if message.author.id != 615673435514863708:
@@ -92,10 +187,13 @@ async def process_message(message: discord.Message):
         )
         return
 
-    game_data = colonist(message, div)
-    if game_data is None and div != Division.CK:
-        game_data = twosheep(message, div)
-    if game_data is None:
+    # these block on http calls, so keep them off the event loop (this also lets
+    # simultaneous posts of the same game get coalesced instead of queueing up)
+    loop = asyncio.get_running_loop()
+    parsed = await loop.run_in_executor(executor, colonist, message, route)
+    if parsed is None and div != Division.CK:
+        parsed = await loop.run_in_executor(executor, twosheep, message, route)
+    if parsed is None:
         # detect if message contains an image embed
         if len(message.attachments) > 0:
             err_msg = "Please include a replay link with your game results (in a new message).\nIn case you already did so in a previous message, you can ignore this warning."
@@ -111,19 +209,65 @@ async def process_message(message: discord.Message):
 
         return  # doesn't contain any colonist/twosheep replay links
     
-    # todo: make this async if we wanna tryhard
-    session = db.get_session()
-    game_data.persist(session)
-    session.commit()
+    # let people know we got it as soon as the scores are in, the rest gets edited in
+    game_data = parsed.game_data
+    recording = None
+    try:
+        await message.add_reaction("🤖")
+        reply = await message.channel.send(
+            game_data.message(author=message.author, status="⏳ Updating standings..."),
+            reference=message,
+        )
+        metrics.record("reply.first_feedback", time.perf_counter() - received_at)
 
-    await message.add_reaction("🤖")
+        recording = loop.run_in_executor(executor, submission.record, route, parsed)
+    finally:
+        # anyone who posted the same game at once is waiting on us to record it first
+        if recording is None and not parsed.is_shared:
+            parsed.recorded.set_exception(
+                Exception("the first post of this game was never recorded")
+            )
 
-    await message.channel.send(
-        game_data.message(author=message.author), reference=message
-    )
+    enriching = loop.run_in_executor(executor, parsed.enrich)
+
+    try:
+        try:
+            await wait_with_deadline(recording, RECORD_DEADLINE)
+        except asyncio.TimeoutError:
+            await reply.edit(
+                content=game_data.message(
+                    author=message.author,
+                    status="⏳ Updating standings is taking longer than usual...",
+                )
+            )
+            await recording
+    except Exception:
+        await reply.edit(
+            content=game_data.message(
+                author=message.author, status="⚠️ Updating standings failed."
+            )
+        )
+        raise
+
+    try:
+        game_data.trivia = await wait_with_deadline(enriching, TRIVIA_DEADLINE)
+    except Exception:
+        pass  # trivia is just for fun, don't hold up the reply for it
+
+    await reply.edit(content=game_data.message(author=message.author))
+    metrics.record("reply.complete", time.perf_counter() - received_at)
+
+
+async def wait_with_deadline(future: asyncio.Future, deadline: float):
+    # shielded, the executor job can't be cancelled anyway and we keep waiting on recording
+    return await asyncio.wait_for(asyncio.shield(future), timeout=deadline)
 
 
 def main():
+    global bot
+
+    load_dotenv()
+
     if get_twosheep_api_key() is None:
         raise Exception(
             "no token found, create a valid .env file with TWOSHEEP_API_KEY"
@@ -136,7 +280,22 @@ def main():
         )
 
     db.start()
-    bot.run(discord_token)
+    routing.seed_default_league()
+    routing.reload_routes()
+    cpu_pool.get_pool()
+
+    bot = create_bot()
+    background_loops.append(
+        tasks.loop(seconds=int(os.getenv("ROUTES_RELOAD_SECONDS", "60")))(reload_routes)
+    )
+    background_loops.append(
+        tasks.loop(minutes=int(os.getenv("METRICS_REPORT_MINUTES", "60")))(report_metrics)
+    )
+
+    try:
+        bot.run(discord_token)
+    finally:
+        cpu_pool.shutdown()
 
 
 if __name__ == "__main__":
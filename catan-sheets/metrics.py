@@ -0,0 +1,29 @@
+from dataclasses import dataclass
+import threading
+
+
+@dataclass
+class Stat:
+    count: int = 0
+    total: float = 0.0
+    max: float = 0.0
+
+
+stats: dict[str, Stat] = {}
+stats_lock = threading.Lock()
+
+
+def record(name: str, value: float):
+    with stats_lock:
+        stat = stats.setdefault(name, Stat())
+        stat.count += 1
+        stat.total += value
+        stat.max = max(stat.max, value)
+
+
+def report() -> str:
+    with stats_lock:
+        return "\n".join(
+            f"{name}: n={stat.count} avg={stat.total / stat.count * 1000:.1f}ms max={stat.max * 1000:.1f}ms"
+            for name, stat in sorted(stats.items())
+        )
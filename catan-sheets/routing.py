@@ -0,0 +1,83 @@
+import db
+from shared import Division, Route
+
+from sqlalchemy import select
+
+
+# only used to seed an empty database, configure leagues in the db afterwards
+DEFAULT_LEAGUE_NAME = "default"
+DEFAULT_WORKERS = 4
+DEFAULT_SPREADSHEET_ID = "1PxYlC7OC0gAeBvfDRknpPCG9PJW63EUZJ2S2gCxzHwQ"
+DEFAULT_ERR_CHANNEL = 1324202972997091480
+DEFAULT_CHANNELS = {
+    Division.DIV1: ("A", [827273190014320652, 1324153205575389207]),
+    Division.DIV2: ("H", [827274292244512780, 1324207273785954364]),
+    Division.CK: ("O", [879366959202983936, 1324500081189060729]),
+}
+
+routes: dict[int, Route] = {}
+
+
+def get_route(channel_id: int) -> Route | None:
+    return routes.get(channel_id)
+
+
+def reload_routes() -> dict[int, Route]:
+    global routes
+
+    session = db.get_session()
+    try:
+        channels = session.scalars(
+            select(db.LeagueChannel).join(db.League).where(db.League.is_active)
+        )
+        new_routes = {
+            int(channel.channel_id): Route(
+                league_id=channel.league.uid,
+                league_name=channel.league.name,
+                division=channel.div,
+                spreadsheet_id=channel.league.spreadsheet_id,
+                sheet_col=channel.sheet_col,
+                err_channel_id=(
+                    int(channel.league.err_channel_id)
+                    if channel.league.err_channel_id
+                    else None
+                ),
+                workers=channel.league.workers,
+            )
+            for channel in channels
+        }
+    finally:
+        session.close()
+
+    # swap the whole map at once so lookups never see a half-loaded config
+    routes = new_routes
+    return routes
+
+
+def seed_default_league():
+    session = db.get_session()
+    try:
+        if session.scalars(select(db.League)).first() is not None:
+            return
+
+        league = db.League(
+            name=DEFAULT_LEAGUE_NAME,
+            spreadsheet_id=DEFAULT_SPREADSHEET_ID,
+            err_channel_id=str(DEFAULT_ERR_CHANNEL),
+            workers=DEFAULT_WORKERS,
+            is_active=True,
+        )
+        session.add(league)
+        for div, (sheet_col, channel_ids) in DEFAULT_CHANNELS.items():
+            for channel_id in channel_ids:
+                session.add(
+                    db.LeagueChannel(
+                        channel_id=str(channel_id),
+                        div=div,
+                        sheet_col=sheet_col,
+                        league=league,
+                    )
+                )
+        session.commit()
+    finally:
+        session.close()
@@ -0,0 +1,109 @@
+from trivia import generate_trivia
+
+from datetime import datetime
+from typing import Any, Callable, NamedTuple, TypeVar
+import json
+import time
+import pytz
+
+
+# everything in here is pure cpu work, so it can be run in a separate process
+# (see cpu_pool.py) and only has to hand back small picklable results
+
+T = TypeVar("T")
+
+
+class ScoredGame(NamedTuple):
+    played_at: datetime
+    scores: list[tuple[str, int]]  # username, victory points
+    # the few parts of the replay that trivia looks at, so it doesn't need the whole thing
+    trivia_input: dict[str, Any] | None = None
+
+
+def timed(cpu_times: dict[str, float], stage: str, f: Callable[[], T]) -> T:
+    # per thread, since inline this shares the process with the bot's other threads
+    start = time.thread_time()
+    result = f()
+    cpu_times[stage] = time.thread_time() - start
+    return result
+
+
+def score_colonist(payload: bytes) -> tuple[ScoredGame, dict[str, float]]:
+    cpu_times: dict[str, float] = {}
+
+    data = timed(cpu_times, "decode", lambda: json.loads(payload)["data"])
+    scores = timed(cpu_times, "score", lambda: colonist_scores(data))
+
+    played_at = datetime.fromisoformat(
+        data["eventHistory"]["startTime"].replace("Z", "+00:00")
+    )
+
+    trivia_input = {
+        "playerUserStates": data["playerUserStates"],
+        "eventHistory": {"endGameState": data["eventHistory"]["endGameState"]},
+    }
+
+    return ScoredGame(played_at, scores, trivia_input), cpu_times
+
+
+def colonist_trivia(trivia_input: dict[str, Any]) -> tuple[str | None, dict[str, float]]:
+    # separate from scoring so it doesn't hold up the first reply
+    cpu_times: dict[str, float] = {}
+
+    trivia = timed(cpu_times, "trivia", lambda: generate_trivia(trivia_input))
+
+    return trivia, cpu_times
+
+
+def colonist_scores(data: dict[str, Any]) -> list[tuple[str, int]]:
+    colors_to_names: dict[int, str] = {
+        player["selectedColor"]: player["username"]
+        for player in data["playerUserStates"]
+    }
+
+    game_players = data["eventHistory"]["endGameState"]["players"]
+
+    scores = []
+    for player in game_players.values():
+        name = colors_to_names[player["color"]]
+
+        vp_data = player["victoryPoints"]
+        settles = vp_data.get("0", 0)
+        cities = vp_data.get("1", 0)
+        vp_devs = vp_data.get("2", 0)
+        largest_army = vp_data.get("3", 0)
+        longest_road = vp_data.get("4", 0)
+        ck_metropolis = vp_data.get("6", 0)
+        ck_catan_points = vp_data.get("7", 0)
+        ck_vps = vp_data.get("8", 0)
+        ck_merchant = vp_data.get("9", 0)
+
+        score = sum(
+            (
+                settles,
+                cities * 2,
+                vp_devs,
+                largest_army * 2,
+                longest_road * 2,
+                ck_metropolis * 2,
+                ck_catan_points,
+                ck_vps,
+                ck_merchant,
+            )
+        )
+        scores.append((name, score))
+
+    return scores
+
+
+def score_twosheep(payload: bytes) -> tuple[ScoredGame, dict[str, float]]:
+    cpu_times: dict[str, float] = {}
+
+    data = timed(cpu_times, "decode", lambda: json.loads(payload))
+    scores = timed(
+        cpu_times, "score", lambda: [(p["n"], p["v"]) for p in data["p"].values()]
+    )
+
+    played_at = datetime.fromtimestamp(data["c"], tz=pytz.UTC)
+
+    return ScoredGame(played_at, scores), cpu_times
@@ -1,11 +1,11 @@
-from trivia import generate_trivia
 import db
 
 import discord
 from dataclasses import dataclass
 from datetime import datetime, timedelta
 from enum import Enum
-from typing import Any, NamedTuple, Sequence
+from typing import NamedTuple, Sequence
+import hashlib
 from sqlalchemy.orm.session import Session
 import pytz
 
@@ -21,6 +21,16 @@ class Site(Enum):
     TWO_SHEEP = "twosheep.io"
 
 
+class Route(NamedTuple):
+    league_id: int
+    league_name: str
+    division: Division
+    spreadsheet_id: str
+    sheet_col: str
+    err_channel_id: int | None
+    workers: int
+
+
 @dataclass
 class GameMetadata:
     division: Division
@@ -78,7 +88,18 @@ class PlayerScore(NamedTuple):
 class GameData:
     metadata: GameMetadata | None
     scores: list[PlayerScore]
-    raw_json: dict[str, Any] | None
+    raw_response: bytes | None  # replay api response as received, only kept for the db
+    trivia: str | None = None
+
+    @property
+    def fingerprint(self) -> str:
+        if self.metadata is None:
+            raise Exception(f"metadata is mandatory for fingerprinting")
+
+        return game_fingerprint(
+            self.metadata.timestamp,
+            [(score.username, score.score) for score in self.scores],
+        )
 
     def persist(self, session: Session):
         if self.metadata is None:
@@ -91,9 +112,10 @@ class GameData:
             timestamp=self.metadata.timestamp,
             is_duplicate=self.metadata.is_duplicate,
             is_old_game=self.metadata.is_old_game,
-            game_json=self.raw_json,
         )
         session.add(game)
+        if self.raw_response is not None:
+            session.add(db.GameReplay(response=self.raw_response.decode(), game=game))
         for player_score in self.scores:
             session.add(
                 db.GamePlayer(
@@ -125,7 +147,9 @@ class GameData:
             for md_row, score in zip(self.metadata.serialize(), self.scores)
         ]
 
-    def message(self, author: discord.User | discord.Member) -> str:
+    def message(
+        self, author: discord.User | discord.Member, status: str | None = None
+    ) -> str:
         if self.metadata is None:
             raise Exception(f"metadata is mandatory for message generation")
 
@@ -142,6 +166,9 @@ class GameData:
         if self.metadata.is_duplicate:
             msg.append("*⚠️ Warning: this game has already been submitted.*")
 
+        if status is not None:
+            msg.append(f"*{status}*")
+
         msg.append("")
 
         for player in self.scores:
@@ -152,13 +179,27 @@ class GameData:
             else:
                 msg.append(f"{player.username}: {player.score} VPs")
 
-        if self.raw_json is not None:
+        if self.trivia is not None:
             msg.append("")
-            msg.append(f"*{generate_trivia(self.raw_json)}*")
+            msg.append(f"*{self.trivia}*")
 
         return "\n".join(msg)
 
 
+def game_fingerprint(played_at: datetime, scores: Sequence[tuple[str, int]]) -> str:
+    # only uses what every replay perspective agrees on (and not the link or how the
+    # timestamp happens to be formatted), so the same game always gets the same one
+    players = sorted(scores)
+    canonical = "|".join(
+        [
+            str(int(played_at.timestamp() * 1000)),
+            ",".join(name for name, _ in players),
+            ",".join(str(score) for _, score in players),
+        ]
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
 def get_discord_user(members: Sequence[discord.Member], discord_name: str):
     discord_user = None
     if discord_name is not None:
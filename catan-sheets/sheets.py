@@ -1,23 +1,34 @@
-from shared import GameData, Division
+from shared import GameData, Route
+import db
 from oauth2client.service_account import ServiceAccountCredentials
 from apiclient import discovery
+from contextlib import contextmanager
 from functools import lru_cache
+import httplib2
+import threading
+import time
 
 
 SCOPE = "https://www.googleapis.com/auth/spreadsheets"
 SERVICE_ACCOUNT_KEY_FILE = "service_account_key.json"
 
-DATA_SPREADSHEET_ID = "1PxYlC7OC0gAeBvfDRknpPCG9PJW63EUZJ2S2gCxzHwQ"
-BASE_SPREADSHEET_ID = "1U7uKsuO2l1SxT3qZSRmdRdX1apjm81pRsnYtFcxMGQQ"
-CK_SPREADSHEET_ID = "1gPnHor5-JuyZmDrb-0MbPBMqwzjaFEy-BDXOFW1Eiyo"
-
-DIV_COLS = {Division.DIV1: "A", Division.DIV2: "H", Division.CK: "O"}
-
 STARTING_DATA_ENTRY_ROW = 4
 DATA_ENTRY_TAB_NAME = "AEON"
 NAMES_TAB_NAME = "Respuestas"
 NAMES_RANGES = ["B3:C"]
 
+# the duplicate check and the row we write to both depend on what's already in the
+# division's columns, so reading & writing them has to happen as one step. the
+# columns can be shared between bot processes, so this is locked in the db as well
+update_locks: dict[tuple[str, str], threading.Lock] = {}
+update_locks_lock = threading.Lock()
+SHEET_LOCK_TTL = 60.0
+# the lock is never renewed, so the read + write done while holding it has to finish
+# well within the ttl, otherwise another process could write to the same row
+SHEETS_HTTP_TIMEOUT = SHEET_LOCK_TTL / 3
+SHEET_LOCK_TIMEOUT = 120.0
+SHEET_LOCK_POLL = 0.25
+
 
 def get_creds():
     creds = ServiceAccountCredentials.from_json_keyfile_name(
@@ -30,11 +41,12 @@ def get_creds():
 
 
 def get_service(creds):
-    return discovery.build("sheets", "v4", credentials=creds)
+    http = creds.authorize(httplib2.Http(timeout=SHEETS_HTTP_TIMEOUT))
+    return discovery.build("sheets", "v4", http=http)
 
 
 @lru_cache(maxsize=1)
-def fetch_member_names(creds, div: Division):
+def fetch_member_names(creds, spreadsheet_id: str):
     service = get_service(creds)
     member_names = {}
 
@@ -44,7 +56,7 @@ def fetch_member_names(creds, div: Division):
         result = (
             service.spreadsheets()
             .values()
-            .get(spreadsheetId=DATA_SPREADSHEET_ID, range=range_to_read)
+            .get(spreadsheetId=spreadsheet_id, range=range_to_read)
             .execute()
         )
         values = result.get("values", [])
@@ -54,41 +66,77 @@ def fetch_member_names(creds, div: Division):
     return member_names
 
 
-def translate_name(creds, div: Division, name: str):
-    discord_to_colonist = fetch_member_names(creds, div)
+def translate_name(creds, route: Route, name: str):
+    discord_to_colonist = fetch_member_names(creds, route.spreadsheet_id)
 
     if name in discord_to_colonist:
         return discord_to_colonist[name]
 
 
-def update(creds, div: Division, game_data: GameData):
+def update(creds, route: Route, game_data: GameData):
     if game_data.metadata is None:
         raise Exception("cannot update without metadata")
 
     service = get_service(creds)
 
-    sheet = service.spreadsheets()
+    with sheet_lock(route):
+        write_game(service.spreadsheets(), route, game_data)
+
+
+@contextmanager
+def sheet_lock(route: Route):
+    # threads of this process wait on each other locally instead of polling the db
+    with get_update_lock(route):
+        deadline = time.monotonic() + SHEET_LOCK_TIMEOUT
+        token = db.acquire_sheet_lock(route.spreadsheet_id, route.sheet_col, SHEET_LOCK_TTL)
+        while token is None:
+            if time.monotonic() > deadline:
+                raise Exception(
+                    f"timed out waiting for sheet lock on {route.spreadsheet_id} {route.sheet_col}"
+                )
+            time.sleep(SHEET_LOCK_POLL)
+            token = db.acquire_sheet_lock(
+                route.spreadsheet_id, route.sheet_col, SHEET_LOCK_TTL
+            )
+
+        try:
+            yield
+        finally:
+            db.release_sheet_lock(token)
+
+
+def get_update_lock(route: Route):
+    with update_locks_lock:
+        key = (route.spreadsheet_id, route.sheet_col)
+        if key not in update_locks:
+            update_locks[key] = threading.Lock()
+        return update_locks[key]
+
+
+def write_game(sheet, route: Route, game_data: GameData):
+    if game_data.metadata is None:
+        raise Exception("cannot update without metadata")
 
-    metadata_col = DIV_COLS[div]
+    metadata_col = route.sheet_col
     # first row is metadata, so when checking for empty rows, skip it
     name_col = add_char(metadata_col, 1)
     range_to_read = (
         f"{DATA_ENTRY_TAB_NAME}!{metadata_col}{STARTING_DATA_ENTRY_ROW}:{name_col}"
     )
     res = (
-        sheet.values().get(spreadsheetId=DATA_SPREADSHEET_ID, range=range_to_read).execute()
+        sheet.values().get(spreadsheetId=route.spreadsheet_id, range=range_to_read).execute()
     )
     existing_rows = res.get("values", [])
 
     if len(existing_rows) > 0 and len(existing_rows[0]) > 0:
+        # other perspectives of the same game are caught by the fingerprint, this is
+        # for games that were entered by hand or before we had fingerprints
         is_duplicate_url = game_data.metadata.replay_link in [
             row[0] for row in existing_rows
         ]
-        # replay url differs based on player perspective, so check timestamps as well!
-        is_duplicate_timestamp = game_data.metadata.timestamp.isoformat() in [
-            row[0] for row in existing_rows
-        ]
-        game_data.metadata.is_duplicate = is_duplicate_url or is_duplicate_timestamp
+        game_data.metadata.is_duplicate = (
+            game_data.metadata.is_duplicate or is_duplicate_url
+        )
 
     first_empty_row = STARTING_DATA_ENTRY_ROW + len(existing_rows)
     last_col = add_char(metadata_col, 3)
@@ -100,7 +148,7 @@ def update(creds, div: Division, game_data: GameData):
     (
         sheet.values()
         .update(
-            spreadsheetId=DATA_SPREADSHEET_ID,
+            spreadsheetId=route.spreadsheet_id,
             range=range_to_write,
             valueInputOption="RAW",
             body={"values": game_data.serialize()},
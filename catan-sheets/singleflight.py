@@ -0,0 +1,66 @@
+from concurrent.futures import Future
+from typing import Callable, Generic, Hashable, TypeVar
+import threading
+
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class SingleFlight(Generic[K, V]):
+    """Coalesces concurrent calls for the same key into a single call.
+
+    The first caller for a key (the leader) runs the function, everyone else who
+    asks for the same key while it's still running just waits for its result.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict[K, Future[V]] = {}
+
+    def do(self, key: K, fn: Callable[[], V]) -> tuple[V, bool]:
+        """Returns the result and whether it was shared with an earlier caller."""
+        with self._lock:
+            future = self._calls.get(key)
+            is_leader = future is None
+            if future is None:
+                future = Future()
+                self._calls[key] = future
+
+        if not is_leader:
+            return future.result(), True
+
+        try:
+            future.set_result(fn())
+        except BaseException as err:
+            future.set_exception(err)
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+        return future.result(), False
+
+
+class Once(Generic[V]):
+    """Runs the function on the first call, everyone calling after or at the same time
+    gets the same result."""
+
+    def __init__(self, fn: Callable[[], V]):
+        self._fn = fn
+        self._lock = threading.Lock()
+        self._future: Future[V] | None = None
+
+    def __call__(self) -> V:
+        with self._lock:
+            future = self._future
+            is_first = future is None
+            if future is None:
+                future = self._future = Future()
+
+        if is_first:
+            try:
+                future.set_result(self._fn())
+            except BaseException as err:
+                future.set_exception(err)
+
+        return future.result()
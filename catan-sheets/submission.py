@@ -0,0 +1,120 @@
+from shared import GameData, GameMetadata, PlayerScore, Route, Site, get_discord_user
+import db
+import sheets
+
+from concurrent.futures import Future
+from datetime import datetime
+from typing import Callable, NamedTuple
+import discord
+
+
+# how long someone who posted the same game waits for the first poster's write
+LEADER_TIMEOUT = 180.0
+
+
+class ParsedReplay(NamedTuple):
+    """What everyone posting the same replay at once shares. Names are resolved per post,
+    since the posts can come from different guilds."""
+
+    site: Site
+    replay_link: str
+    played_at: datetime
+    scores: list[tuple[str, int]]  # username, victory points
+    raw_response: bytes | None
+    enrich: Callable[[], str | None]  # trivia
+    recorded: Future[None]
+
+
+class Submission(NamedTuple):
+    """A parsed game, split from the slower steps so we can reply before they're done."""
+
+    game_data: GameData
+    is_shared: bool  # someone else posted the same link at the same time
+    enrich: Callable[[], str | None]  # trivia
+    recorded: Future[None]  # shared with everyone who posted the same link
+
+
+def to_submission(
+    message: discord.Message, route: Route, replay: ParsedReplay, is_shared: bool
+) -> Submission:
+    try:
+        return build_submission(message, route, replay, is_shared)
+    except Exception as err:
+        # the first poster won't get to record(), don't keep the others waiting on it
+        if not is_shared:
+            replay.recorded.set_exception(err)
+        raise
+
+
+def build_submission(
+    message: discord.Message, route: Route, replay: ParsedReplay, is_shared: bool
+) -> Submission:
+    members = message.guild.members  # type: ignore
+    gapi_creds = sheets.get_creds()
+
+    game_data = GameData(metadata=None, scores=[], raw_response=replay.raw_response)
+
+    for name, score in replay.scores:
+        discord_name = sheets.translate_name(gapi_creds, route, name)
+        discord_user = get_discord_user(members, discord_name) if discord_name else None
+
+        game_data.scores.append(
+            PlayerScore.from_names(discord_user, discord_name, name, score)
+        )
+
+    game_data.metadata = GameMetadata(
+        division=route.division,
+        site=replay.site,
+        replay_link=replay.replay_link,
+        timestamp=replay.played_at,
+        is_duplicate=False
+    )
+
+    return Submission(
+        game_data=game_data,
+        is_shared=is_shared,
+        enrich=replay.enrich,
+        recorded=replay.recorded,
+    )
+
+
+def record(route: Route, submission: Submission):
+    game_data = submission.game_data
+    if game_data.metadata is None:
+        raise Exception("cannot record without metadata")
+
+    if submission.is_shared:
+        # let whoever got here first go first, if their write failed we take over
+        try:
+            submission.recorded.result(timeout=LEADER_TIMEOUT)
+        except Exception:
+            pass
+
+    try:
+        claimed = db.claim_fingerprint(
+            route.league_id, game_data.fingerprint, game_data.metadata.replay_link
+        )
+        game_data.metadata.is_duplicate = not claimed
+
+        try:
+            sheets.update(sheets.get_creds(), route, game_data)
+        except Exception:
+            # otherwise a repost would be flagged as a duplicate of a game that isn't there
+            if claimed:
+                db.release_fingerprint(route.league_id, game_data.fingerprint)
+            raise
+    except Exception as err:
+        if not submission.is_shared:
+            submission.recorded.set_exception(err)
+        raise
+
+    if not submission.is_shared:
+        submission.recorded.set_result(None)
+
+    # right away, so nothing that goes wrong replying on discord can lose the game
+    session = db.get_session()
+    try:
+        game_data.persist(session)
+        session.commit()
+    finally:
+        session.close()
@@ -1,68 +1,64 @@
-from datetime import datetime
 from dotenv import load_dotenv
-from shared import Division, GameData, GameMetadata, PlayerScore, Site, get_discord_user
-import sheets
+from shared import Division, Route, Site
+from scoring import score_twosheep
+from singleflight import SingleFlight
+from submission import ParsedReplay, Submission, to_submission
+import cpu_pool
 
+from concurrent.futures import Future
 from functools import cache
 import re
 import discord
 import requests
 import os
-import pytz
 
 
 TWOSHEEP_REPLAY_REGEX = r"twosheep\.io\/replay\/([A-Za-z0-9-_]+)"
 
 HEADERS = {"Content-Type": "application/json"}
 
+inflight: SingleFlight[tuple[int, Division, Site, str], ParsedReplay] = SingleFlight()
 
-def twosheep(message: discord.Message, div: Division):
-    if div == "CK":
+
+def twosheep(message: discord.Message, route: Route) -> Submission | None:
+    if route.division == Division.CK:
         return None
 
     slug_matches = re.findall(TWOSHEEP_REPLAY_REGEX, message.content, re.DOTALL)
     if len(slug_matches) == 0:
         return None
-    data = query_twosheep(slug_matches[0])
-
-    members = message.guild.members  # type: ignore
-    gapi_creds = sheets.get_creds()
-
-    played_at_epoch = data["c"]
-    played_at = datetime.fromtimestamp(played_at_epoch, tz=pytz.UTC)
-
-    game_data = GameData(metadata=None, scores=[], raw_json=None)  # no trivia support
+    slug = slug_matches[0]
 
-    for player in data["p"].values():
-        name = player["n"]
-        score = player["v"]
+    replay, is_shared = inflight.do(
+        (route.league_id, route.division, Site.TWO_SHEEP, slug),
+        lambda: parse_twosheep(slug),
+    )
+    return to_submission(message, route, replay, is_shared)
 
-        discord_name = sheets.translate_name(gapi_creds, div, name)
-        discord_user = get_discord_user(members, discord_name) if discord_name else None
 
-        game_data.scores.append(PlayerScore.from_names(discord_user, discord_name, name, score))
+def parse_twosheep(slug: str) -> ParsedReplay:
+    scored = cpu_pool.run("twosheep", score_twosheep, query_twosheep(slug))
 
-    game_data.metadata = GameMetadata(
-        division=div,
+    # no trivia support, and we don't keep twosheep replays around either
+    return ParsedReplay(
         site=Site.TWO_SHEEP,
-        replay_link=f"https://twosheep.io/replay/{slug_matches[0]}",
-        timestamp=played_at,
-        is_duplicate=False
+        replay_link=f"https://twosheep.io/replay/{slug}",
+        played_at=scored.played_at,
+        scores=scored.scores,
+        raw_response=None,
+        enrich=lambda: None,
+        recorded=Future(),
     )
 
-    sheets.update(gapi_creds, div, game_data)
-
-    return game_data
-
 
-def query_twosheep(game_slug: str):
+def query_twosheep(game_slug: str) -> bytes:
     api_key = get_twosheep_api_key()
     api_url = f"https://twosheep.io/api/getReplay?id={game_slug}&apiKey={api_key}"
     res = requests.get(api_url, headers=HEADERS)
     if res.status_code != 200:
         raise Exception(f"twosheep.io api call failed with {res.status_code}")
 
-    return res.json()
+    return res.content
 
 
 def get_twosheep_api_key():